@@ -9,19 +9,35 @@ Modified: January 2026
 
 import os
 import re
-import json
 import time
+import asyncio
 import random
 import hashlib
-from io import BytesIO
-from typing import Dict, Optional, List
+import socket
+import sqlite3
+import weakref
+import logging
+import urllib.request
+from collections import OrderedDict
+from datetime import date
+from functools import lru_cache
+from typing import Dict, Optional, List, Tuple
 from pathlib import Path
 
 import httpx
-from telebot import TeleBot, types
+import orjson
+from telebot.async_telebot import AsyncTeleBot
 from telebot.types import InlineKeyboardMarkup, InlineKeyboardButton
 
 # ============ CONFIG ============
+# Configure only the bot's own logger; telebot's logger already has its own handler
+log = logging.getLogger("gemini_bot")
+log.setLevel(logging.INFO)
+_log_handler = logging.StreamHandler()
+_log_handler.setFormatter(logging.Formatter("%(asctime)s %(levelname)s %(message)s"))
+log.addHandler(_log_handler)
+log.propagate = False
+
 BOT_TOKEN = os.getenv("BOT_TOKEN")
 if not BOT_TOKEN:
     raise ValueError("❌ BOT_TOKEN environment variable required!")
@@ -36,48 +52,135 @@ ID_CARD_API_URL = "https://id-livid-phi.vercel.app/generate"
 MIN_DELAY = 300
 MAX_DELAY = 800
 
-bot = TeleBot(BOT_TOKEN, parse_mode="HTML")
+SESSION_MAX = 10_000
+SESSION_TTL = 3600
+
+_VID_KEY = "verificationId="
+_HEX_RE = re.compile(r"[a-f0-9]+", re.IGNORECASE)
+_DOB_RE = re.compile(r'^\d{4}-\d{2}-\d{2}$')
+
+SEARCH_CACHE_TTL = 3600
+SEARCH_CACHE_SIZE = 512
+
+bot = AsyncTeleBot(BOT_TOKEN, parse_mode="HTML")
+
+# Pooled connections stay open up to KEEPALIVE_EXPIRY idle; TCP keepalive probes keep them from
+# being silently dropped by NAT/load-balancer idle timeouts within that window
+KEEPALIVE_EXPIRY = 300.0
+
+_SOCKET_OPTIONS = [(socket.SOL_SOCKET, socket.SO_KEEPALIVE, 1)]
+if hasattr(socket, "TCP_KEEPIDLE"):
+    _SOCKET_OPTIONS += [
+        (socket.IPPROTO_TCP, socket.TCP_KEEPIDLE, 30),
+        (socket.IPPROTO_TCP, socket.TCP_KEEPINTVL, 10),
+        (socket.IPPROTO_TCP, socket.TCP_KEEPCNT, 3),
+    ]
+
+# Shared HTTP client: keep-alive connections to SheerID/org search/ID API are reused across all users
+# An explicit transport disables httpx's env proxy lookup, so pass HTTPS_PROXY/ALL_PROXY through
+# (all outbound URLs are https; NO_PROXY is not applied)
+_PROXIES = urllib.request.getproxies()
+
+HTTP = httpx.AsyncClient(
+    timeout=httpx.Timeout(30.0, connect=5.0),
+    transport=httpx.AsyncHTTPTransport(
+        http2=True,
+        limits=httpx.Limits(max_connections=50, max_keepalive_connections=32, keepalive_expiry=KEEPALIVE_EXPIRY),
+        socket_options=_SOCKET_OPTIONS,
+        proxy=_PROXIES.get("https") or _PROXIES.get("all"),
+    ),
+)
 
 # User sessions
-user_sessions = {}
+class SessionStore:
+    """Per-user session dicts, LRU-bounded; sessions idle longer than ttl expire"""
+
+    def __init__(self, maxsize: int, ttl: float):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self._data: "OrderedDict[int, Tuple[float, Dict]]" = OrderedDict()
+
+    def get(self, user_id: int, default: Optional[Dict] = None) -> Optional[Dict]:
+        entry = self._data.get(user_id)
+        if entry is None:
+            return default
+        if time.time() - entry[0] > self.ttl:
+            del self._data[user_id]
+            return default
+        self._data[user_id] = (time.time(), entry[1])
+        self._data.move_to_end(user_id)
+        return entry[1]
+
+    def __setitem__(self, user_id: int, session: Dict):
+        now = time.time()
+        self._data[user_id] = (now, session)
+        self._data.move_to_end(user_id)
+        # Oldest entries sit at the front: drop expired ones, then enforce the size cap
+        while self._data:
+            oldest = next(iter(self._data.values()))
+            if now - oldest[0] <= self.ttl and len(self._data) <= self.maxsize:
+                break
+            self._data.popitem(last=False)
+
+user_sessions = SessionStore(SESSION_MAX, SESSION_TTL)
+
+# Per-user locks so one user's updates run one at a time; a lock disappears once nobody holds it
+_session_locks: "weakref.WeakValueDictionary[int, asyncio.Lock]" = weakref.WeakValueDictionary()
+
+def session_lock(user_id: int) -> asyncio.Lock:
+    lock = _session_locks.get(user_id)
+    if lock is None:
+        lock = _session_locks[user_id] = asyncio.Lock()
+    return lock
 
 # Stats
 class Stats:
     def __init__(self):
-        self.file = Path("stats.json")
-        self.data = self._load()
-
-    def _load(self):
-        if self.file.exists():
-            try:
-                return json.loads(self.file.read_text())
-            except:
-                pass
-        return {"total": 0, "success": 0, "failed": 0, "orgs": {}}
-
-    def _save(self):
-        self.file.write_text(json.dumps(self.data, indent=2))
+        self.file = Path("stats.db")
+        self.db = sqlite3.connect(self.file, isolation_level=None)
+        self.db.execute("PRAGMA journal_mode=WAL")
+        # WAL + NORMAL: commits skip fsync, synced at checkpoint; survives process crashes
+        self.db.execute("PRAGMA synchronous=NORMAL")
+        self.db.execute(
+            "CREATE TABLE IF NOT EXISTS orgs ("
+            "name TEXT PRIMARY KEY, success INTEGER NOT NULL DEFAULT 0, failed INTEGER NOT NULL DEFAULT 0)"
+        )
+        self._import_legacy(Path("stats.json"))
+
+    def _import_legacy(self, legacy: Path):
+        """One-time import of counts from the old stats.json"""
+        if not legacy.exists() or self.db.execute("SELECT 1 FROM orgs LIMIT 1").fetchone():
+            return
+        try:
+            orgs = orjson.loads(legacy.read_bytes()).get("orgs", {})
+        except:
+            return
+        self.db.executemany(
+            "INSERT INTO orgs(name, success, failed) VALUES(?, ?, ?)",
+            [(name, o.get("success", 0), o.get("failed", 0)) for name, o in orgs.items()],
+        )
 
     def record(self, org: str, success: bool):
-        self.data["total"] += 1
-        self.data["success" if success else "failed"] += 1
-        if org not in self.data["orgs"]:
-            self.data["orgs"][org] = {"success": 0, "failed": 0}
-        self.data["orgs"][org]["success" if success else "failed"] += 1
-        self._save()
+        self.db.execute(
+            "INSERT INTO orgs(name, success, failed) VALUES(?, ?, ?) "
+            "ON CONFLICT(name) DO UPDATE SET success=success+excluded.success, failed=failed+excluded.failed",
+            (org, int(success), int(not success)),
+        )
 
     def get_summary(self) -> str:
-        total = self.data["total"]
-        success = self.data["success"]
-        failed = self.data["failed"]
+        success, failed = self.db.execute(
+            "SELECT COALESCE(SUM(success), 0), COALESCE(SUM(failed), 0) FROM orgs"
+        ).fetchone()
+        total = success + failed
         rate = (success / total * 100) if total else 0
 
         # Top 5 universities
-        orgs_sorted = sorted(self.data["orgs"].items(), 
-                           key=lambda x: x[1]["success"], reverse=True)[:5]
+        orgs_sorted = self.db.execute(
+            "SELECT name, success FROM orgs ORDER BY success DESC LIMIT 5"
+        ).fetchall()
 
-        top_unis = "\n".join([f"  • {org}: {data['success']} success" 
-                              for org, data in orgs_sorted]) if orgs_sorted else "  No data yet"
+        top_unis = "\n".join([f"  • {org}: {org_success} success" 
+                              for org, org_success in orgs_sorted]) if orgs_sorted else "  No data yet"
 
         return f"""📊 <b>Statistics</b>
 
@@ -92,134 +195,166 @@ Total Attempts: {total}
 stats = Stats()
 
 # ============ UTILITIES ============
-def random_delay():
-    time.sleep(random.randint(MIN_DELAY, MAX_DELAY) / 1000)
+_RESOLUTIONS = ("1920x1080", "1366x768", "1536x864", "1440x900")
+_TIMEZONES = (-8, -7, -6, -5, -4)
+_LANGUAGES = ("en-US", "en-GB")
+_PLATFORMS = ("Win32", "MacIntel")
 
 def generate_fingerprint() -> str:
-    resolutions = ["1920x1080", "1366x768", "1536x864", "1440x900"]
-    timezones = [-8, -7, -6, -5, -4]
-    languages = ["en-US", "en-GB"]
-    platforms = ["Win32", "MacIntel"]
-
-    components = [
-        str(int(time.time() * 1000)),
-        str(random.random()),
-        random.choice(resolutions),
-        str(random.choice(timezones)),
-        random.choice(languages),
-        random.choice(platforms),
-        str(random.randint(4, 16)),
-    ]
-    return hashlib.md5("|".join(components).encode()).hexdigest()
+    # One 4-bit draw picks resolution (2 bits), language and platform (1 bit each)
+    bits = random.getrandbits(4)
+    components = (
+        f"{int(time.time() * 1000)}|{random.random()}|{_RESOLUTIONS[bits & 3]}|"
+        f"{random.choice(_TIMEZONES)}|{_LANGUAGES[(bits >> 2) & 1]}|{_PLATFORMS[bits >> 3]}|"
+        f"{random.randint(4, 16)}"
+    )
+    return hashlib.blake2b(components.encode("ascii"), digest_size=16).hexdigest()
 
 # ============ UNIVERSITY SEARCH ============
-def search_universities(query: str) -> List[Dict]:
+_search_cache: "OrderedDict[str, Tuple[float, List[Dict]]]" = OrderedDict()
+
+async def search_universities(query: str) -> List[Dict]:
+    key = query.strip().lower()
+    cached = _search_cache.get(key)
+    if cached and time.time() - cached[0] < SEARCH_CACHE_TTL:
+        _search_cache.move_to_end(key)
+        return cached[1]
+
     try:
-        client = httpx.Client(timeout=30)
         params = {"country": "US", "type": "UNIVERSITY", "name": query}
-        resp = client.get(ORG_SEARCH_URL, params=params)
-        client.close()
+        resp = await HTTP.get(ORG_SEARCH_URL, params=params)
 
         if resp.status_code == 200:
-            results = resp.json()
-            return results[:15] if isinstance(results, list) else []
+            results = orjson.loads(resp.content)
+            results = results[:15] if isinstance(results, list) else []
+            _search_cache[key] = (time.time(), results)
+            _search_cache.move_to_end(key)
+            if len(_search_cache) > SEARCH_CACHE_SIZE:
+                _search_cache.popitem(last=False)
+            return results
         return []
-    except Exception as e:
-        print(f"Search error: {e}")
+    except Exception:
+        log.exception("Search error for query=%s", query)
         return []
 
 # ============ STUDENT ID CARD GENERATOR ============
-def generate_student_id(first: str, last: str, school: str, dob: str) -> bytes:
+_ID_CARD_BASE = {
+    "academicyear": "2025-2028",
+    "exp_date": "31 DEC 2028",
+    "issue_txt": "Date Of Issue",
+    "exp_txt": "Card Expires",
+    "id": "1",
+    "opacity": 0.15,
+    "principal": "Dr. Academic Dean"
+}
+
+@lru_cache(maxsize=1)
+def _issue_date(day: int) -> str:
+    return date.fromordinal(day).strftime("%d %b %Y").upper()
+
+async def generate_student_id(first: str, last: str, school: str, dob: str) -> bytes:
     """Generate student ID card using external API"""
     try:
-        client = httpx.Client(timeout=60)
-
-        # Random template and style for variation
-        template = str(random.randint(1, 2))
-        style = str(random.randint(1, 6))
-
-        # Generate random student ID
-        id_value = f"{random.randint(100, 999)}-{random.randint(100, 999)}-{random.randint(1000, 9999)}"
+        # One 64-bit draw, sliced into template/style and the three student ID groups
+        r = random.getrandbits(64)
+        template = str((r & 1) + 1)
+        style = str((r >> 1 & 0x7F) % 6 + 1)
+        id_value = f"{(r >> 8 & 0xFFFF) % 900 + 100}-{(r >> 24 & 0xFFFF) % 900 + 100}-{(r >> 40) % 9000 + 1000}"
 
         payload = {
+            **_ID_CARD_BASE,
             "name": f"{first} {last}",
             "university_name": school,
             "dob": dob,
-            "academicyear": "2025-2028",
             "template": template,
             "style": style,
             "id_value": id_value,
-            "issue_date": time.strftime("%d %b %Y").upper(),
-            "exp_date": "31 DEC 2028",
-            "issue_txt": "Date Of Issue",
-            "exp_txt": "Card Expires",
-            "id": "1",
-            "opacity": 0.15,
-            "principal": "Dr. Academic Dean"
+            "issue_date": _issue_date(date.today().toordinal())
         }
 
-        response = client.post(ID_CARD_API_URL, json=payload)
-        client.close()
+        response = await HTTP.post(ID_CARD_API_URL, json=payload, timeout=60)
 
         if response.status_code == 200:
-            print(f"✅ Student ID card generated: {school}")
+            log.info("✅ Student ID card generated: %s", school)
             return response.content
         else:
             raise Exception(f"API returned status {response.status_code}")
 
     except Exception as e:
-        print(f"❌ Student ID generation error: {e}")
+        log.error("❌ Student ID generation error: %s", e)
         raise Exception(f"Failed to generate student ID card: {e}")
 
 # ============ VERIFIER ============
+_VERIF_URL_PREFIX = f"{SHEERID_API_URL}/verification/"
+_REFERER_PREFIX = f"https://services.sheerid.com/verify/{PROGRAM_ID}/?verificationId="
+
+# Steps the bot can act on
+_VALID_STEPS = ("collectStudentPersonalInfo", "docUpload", "sso")
+
+_JSON_HEADERS = {"Content-Type": "application/json"}
+
+_METADATA_BASE = {
+    "marketConsentValue": False,
+    "flags": '{"collect-info-step-email-first":"default"}',
+    "submissionOptIn": "By submitting..."
+}
+
 class GeminiVerifier:
     def __init__(self, url: str):
         self.url = url
         self.vid = self._parse_id(url)
+        self.base_url = f"{_VERIF_URL_PREFIX}{self.vid}"
         self.fingerprint = generate_fingerprint()
-        self.client = httpx.Client(timeout=30)
         self.org = None
-
-    def __del__(self):
-        if hasattr(self, "client"):
-            self.client.close()
+        self._last_request = time.monotonic()
 
     @staticmethod
     def _parse_id(url: str) -> Optional[str]:
-        match = re.search(r"verificationId=([a-f0-9]+)", url, re.IGNORECASE)
-        return match.group(1) if match else None
-
-    def _request(self, method: str, endpoint: str, body: Dict = None):
-        random_delay()
+        idx = url.find(_VID_KEY)
+        if idx == -1:
+            return None
+        start = idx + len(_VID_KEY)
+        match = _HEX_RE.match(url, start, start + 64)
+        return match.group(0) if match else None
+
+    async def _throttle(self):
+        """Wait out the rest of a random MIN_DELAY-MAX_DELAY ms gap since the last SheerID call"""
+        gap = random.randint(MIN_DELAY, MAX_DELAY) / 1000
+        wait = gap - (time.monotonic() - self._last_request)
+        if wait > 0:
+            await asyncio.sleep(wait)
+
+    async def _request(self, method: str, suffix: str = "", body: Dict = None):
+        await self._throttle()
         try:
-            headers = {"Content-Type": "application/json"}
-            resp = self.client.request(method, f"{SHEERID_API_URL}{endpoint}", json=body, headers=headers)
+            resp = await HTTP.request(method, self.base_url + suffix, json=body, headers=_JSON_HEADERS)
             try:
-                parsed = resp.json() if resp.text else {}
+                parsed = orjson.loads(resp.content) if resp.content else {}
             except:
                 parsed = {"_text": resp.text}
             return parsed, resp.status_code
         except Exception as e:
             raise Exception(f"Request failed: {e}")
+        finally:
+            self._last_request = time.monotonic()
 
-    def _upload_s3(self, url: str, data: bytes) -> bool:
+    async def _upload_s3(self, url: str, data: bytes) -> bool:
         try:
-            resp = self.client.put(url, content=data, headers={"Content-Type": "image/png"}, timeout=60)
+            resp = await HTTP.put(url, content=data, headers={"Content-Type": "image/png"}, timeout=60)
             return 200 <= resp.status_code < 300
         except:
             return False
 
-    def check_link(self) -> Dict:
+    async def check_link(self) -> Dict:
         if not self.vid:
             return {"valid": False, "error": "Invalid URL"}
 
-        data, status = self._request("GET", f"/verification/{self.vid}")
+        data, status = await self._request("GET")
         if status != 200:
             return {"valid": False, "error": f"HTTP {status}"}
 
         step = data.get("currentStep", "")
-        valid_steps = ["collectStudentPersonalInfo", "docUpload", "sso"]
-        if step in valid_steps:
+        if step in _VALID_STEPS:
             return {"valid": True, "step": step}
         elif step == "success":
             return {"valid": False, "error": "Already verified"}
@@ -227,15 +362,30 @@ class GeminiVerifier:
             return {"valid": False, "error": "Already pending review"}
         return {"valid": False, "error": f"Invalid step: {step}"}
 
-    def verify(self, user_data: Dict, org: Dict) -> Dict:
+    async def verify(self, user_data: Dict, org: Dict, initial_step: Optional[str] = None) -> Dict:
         if not self.vid:
             return {"success": False, "error": "Invalid verification URL"}
 
+        doc_task = None
         try:
             self.org = org
 
-            check_data, check_status = self._request("GET", f"/verification/{self.vid}")
-            current_step = check_data.get("currentStep", "") if check_status == 200 else ""
+            step_cached = initial_step in _VALID_STEPS
+            if step_cached:
+                # Step already fetched by check_link(), skip the duplicate GET
+                current_step = initial_step
+            else:
+                check_data, check_status = await self._request("GET")
+                current_step = check_data.get("currentStep", "") if check_status == 200 else ""
+
+            # Start generating the ID card now so it overlaps the SheerID calls before docUpload
+            if current_step in _VALID_STEPS:
+                doc_task = asyncio.create_task(generate_student_id(
+                    user_data["firstName"],
+                    user_data["lastName"],
+                    org["name"],
+                    user_data["birthDate"]
+                ))
 
             if current_step == "collectStudentPersonalInfo":
                 body = {
@@ -248,15 +398,20 @@ class GeminiVerifier:
                     "deviceFingerprintHash": self.fingerprint,
                     "locale": "en-US",
                     "metadata": {
-                        "marketConsentValue": False,
+                        **_METADATA_BASE,
                         "verificationId": self.vid,
-                        "refererUrl": f"https://services.sheerid.com/verify/{PROGRAM_ID}/?verificationId={self.vid}",
-                        "flags": '{"collect-info-step-email-first":"default"}',
-                        "submissionOptIn": "By submitting..."
+                        "refererUrl": _REFERER_PREFIX + self.vid
                     }
                 }
 
-                data, status = self._request("POST", f"/verification/{self.vid}/step/collectStudentPersonalInfo", body)
+                data, status = await self._request("POST", "/step/collectStudentPersonalInfo", body)
+
+                if step_cached and (status != 200 or data.get("currentStep") == "error"):
+                    # Cached step may be stale: re-check the live step once before counting a failure
+                    check_data, check_status = await self._request("GET")
+                    fresh_step = check_data.get("currentStep", "") if check_status == 200 else ""
+                    if fresh_step and fresh_step != "collectStudentPersonalInfo":
+                        data, status = check_data, 200
 
                 if status != 200:
                     stats.record(org["name"], False)
@@ -278,34 +433,28 @@ class GeminiVerifier:
                 }
 
             if current_step == "sso":
-                self._request("DELETE", f"/verification/{self.vid}/step/sso")
-                check_data, _ = self._request("GET", f"/verification/{self.vid}")
+                await self._request("DELETE", "/step/sso")
+                check_data, _ = await self._request("GET")
                 current_step = check_data.get("currentStep", "")
 
             if current_step == "docUpload":
-                # Generate student ID card
-                doc = generate_student_id(
-                    user_data["firstName"], 
-                    user_data["lastName"], 
-                    org["name"], 
-                    user_data["birthDate"]
-                )
+                doc = await doc_task
 
                 filename = "student_id.png"
 
                 upload_body = {"files": [{"fileName": filename, "mimeType": "image/png", "fileSize": len(doc)}]}
-                data, status = self._request("POST", f"/verification/{self.vid}/step/docUpload", upload_body)
+                data, status = await self._request("POST", "/step/docUpload", upload_body)
 
                 if not data.get("documents"):
                     stats.record(org["name"], False)
                     return {"success": False, "error": "No upload URL"}
 
                 upload_url = data["documents"][0].get("uploadUrl")
-                if not self._upload_s3(upload_url, doc):
+                if not await self._upload_s3(upload_url, doc):
                     stats.record(org["name"], False)
                     return {"success": False, "error": "Upload failed"}
 
-                data, status = self._request("POST", f"/verification/{self.vid}/step/completeDocUpload")
+                data, status = await self._request("POST", "/step/completeDocUpload")
 
                 stats.record(org["name"], True)
 
@@ -313,7 +462,7 @@ class GeminiVerifier:
                     "success": True,
                     "instant": False,
                     "message": "📄 Document uploaded! Wait 24-48h for manual review.",
-                    "document": BytesIO(doc)
+                    "document": doc
                 }
 
             return {
@@ -327,11 +476,19 @@ class GeminiVerifier:
             if self.org:
                 stats.record(self.org["name"], False)
             return {"success": False, "error": str(e)}
+        finally:
+            # Card not needed (instant success / early failure): stop it and swallow its error
+            if doc_task is not None:
+                if not doc_task.done():
+                    doc_task.cancel()
+                elif not doc_task.cancelled():
+                    doc_task.exception()
 
 # ============ BOT HANDLERS ============
 @bot.message_handler(commands=['start'])
-def start_command(message):
-    user_sessions[message.chat.id] = {}
+async def start_command(message):
+    async with session_lock(message.chat.id):
+        user_sessions[message.chat.id] = {}
 
     text = """🤖 <b>Google One (Gemini) Verification Bot</b>
 
@@ -356,10 +513,10 @@ Bot ini membantu Anda mengisi verifikasi student untuk Google One AI Premium (Ge
 
 <i>Note: US universities only untuk new sign-ups (Jan 2026)</i>"""
 
-    bot.send_message(message.chat.id, text)
+    await bot.send_message(message.chat.id, text)
 
 @bot.message_handler(commands=['help'])
-def help_command(message):
+async def help_command(message):
     text = """❓ <b>Bantuan</b>
 
 <b>Format URL:</b>
@@ -385,142 +542,166 @@ https://services.sheerid.com/verify/...?verificationId=xxx
 <b>Developer:</b>
 @ThanhNguyxn"""
 
-    bot.send_message(message.chat.id, text)
+    await bot.send_message(message.chat.id, text)
 
 @bot.message_handler(commands=['stats'])
-def stats_command(message):
+async def stats_command(message):
     if ADMIN_IDS and message.chat.id not in ADMIN_IDS:
-        bot.send_message(message.chat.id, "❌ Admin only command")
+        await bot.send_message(message.chat.id, "❌ Admin only command")
         return
 
-    bot.send_message(message.chat.id, stats.get_summary())
+    await bot.send_message(message.chat.id, stats.get_summary())
 
 @bot.message_handler(commands=['verify'])
-def verify_command(message):
-    user_sessions[message.chat.id] = {"step": "url"}
-    bot.send_message(message.chat.id, "📎 Kirim verification URL dari SheerID:")
+async def verify_command(message):
+    async with session_lock(message.chat.id):
+        user_sessions[message.chat.id] = {"step": "url"}
+    await bot.send_message(message.chat.id, "📎 Kirim verification URL dari SheerID:")
 
-@bot.message_handler(func=lambda m: True)
-def handle_message(message):
+async def _handle_url(message, session):
     user_id = message.chat.id
-    session = user_sessions.get(user_id, {})
-    step = session.get("step")
+    url = message.text.strip()
+    if "sheerid.com" not in url or "verificationId=" not in url:
+        await bot.send_message(user_id, "❌ URL tidak valid. Harus berisi 'sheerid.com' dan 'verificationId='")
+        return
+
+    msg = await bot.send_message(user_id, "⏳ Checking URL...")
 
-    if not step:
-        bot.send_message(user_id, "⚠️ Gunakan /verify untuk mulai")
+    verifier = GeminiVerifier(url)
+    check = await verifier.check_link()
+
+    if not check.get("valid"):
+        await bot.edit_message_text(f"❌ {check.get('error')}", user_id, msg.message_id)
+        user_sessions[user_id] = {}
         return
 
-    if step == "url":
-        url = message.text.strip()
-        if "sheerid.com" not in url or "verificationId=" not in url:
-            bot.send_message(user_id, "❌ URL tidak valid. Harus berisi 'sheerid.com' dan 'verificationId='")
-            return
+    await bot.edit_message_text(f"✅ URL valid (step: {check.get('step')})", user_id, msg.message_id)
 
-        msg = bot.send_message(user_id, "⏳ Checking URL...")
+    session["url"] = url
+    session["initial_step"] = check["step"]
+    session["step"] = "first_name"
+    await bot.send_message(user_id, "👤 Masukkan <b>nama depan</b> (First Name):")
 
-        verifier = GeminiVerifier(url)
-        check = verifier.check_link()
+async def _handle_first_name(message, session):
+    user_id = message.chat.id
+    session["firstName"] = message.text.strip()
+    session["step"] = "last_name"
+    await bot.send_message(user_id, "👤 Masukkan <b>nama belakang</b> (Last Name):")
 
-        if not check.get("valid"):
-            bot.edit_message_text(f"❌ {check.get('error')}", user_id, msg.message_id)
-            user_sessions[user_id] = {}
-            return
+async def _handle_last_name(message, session):
+    user_id = message.chat.id
+    session["lastName"] = message.text.strip()
+    session["step"] = "email"
+    await bot.send_message(user_id, "📧 Masukkan <b>email</b>:")
 
-        bot.edit_message_text(f"✅ URL valid (step: {check.get('step')})", user_id, msg.message_id)
+async def _handle_email(message, session):
+    user_id = message.chat.id
+    email = message.text.strip()
+    if "@" not in email:
+        await bot.send_message(user_id, "❌ Email tidak valid. Coba lagi:")
+        return
+    session["email"] = email
+    session["step"] = "dob"
+    await bot.send_message(user_id, "🎂 Masukkan <b>tanggal lahir</b> (format: YYYY-MM-DD):\n\nContoh: 2002-05-15")
 
-        session["url"] = url
-        session["step"] = "first_name"
-        bot.send_message(user_id, "👤 Masukkan <b>nama depan</b> (First Name):")
+async def _handle_dob(message, session):
+    user_id = message.chat.id
+    dob = message.text.strip()
+    if not _DOB_RE.match(dob):
+        await bot.send_message(user_id, "❌ Format tidak valid. Gunakan: YYYY-MM-DD\n\nContoh: 2002-05-15")
+        return
+    session["birthDate"] = dob
+    session["step"] = "uni_search"
+    await bot.send_message(user_id, "🔍 Cari <b>universitas</b> (min 3 karakter):\n\nContoh: Stanford, MIT, UCLA")
 
-    elif step == "first_name":
-        session["firstName"] = message.text.strip()
-        session["step"] = "last_name"
-        bot.send_message(user_id, "👤 Masukkan <b>nama belakang</b> (Last Name):")
+async def _handle_uni_search(message, session):
+    user_id = message.chat.id
+    query = message.text.strip()
+    if len(query) < 3:
+        await bot.send_message(user_id, "❌ Minimal 3 karakter")
+        return
 
-    elif step == "last_name":
-        session["lastName"] = message.text.strip()
-        session["step"] = "email"
-        bot.send_message(user_id, "📧 Masukkan <b>email</b>:")
+    msg = await bot.send_message(user_id, f"⏳ Searching '{query}'...")
 
-    elif step == "email":
-        email = message.text.strip()
-        if "@" not in email:
-            bot.send_message(user_id, "❌ Email tidak valid. Coba lagi:")
-            return
-        session["email"] = email
-        session["step"] = "dob"
-        bot.send_message(user_id, "🎂 Masukkan <b>tanggal lahir</b> (format: YYYY-MM-DD):\n\nContoh: 2002-05-15")
-
-    elif step == "dob":
-        dob = message.text.strip()
-        if not re.match(r'^\d{4}-\d{2}-\d{2}$', dob):
-            bot.send_message(user_id, "❌ Format tidak valid. Gunakan: YYYY-MM-DD\n\nContoh: 2002-05-15")
-            return
-        session["birthDate"] = dob
-        session["step"] = "uni_search"
-        bot.send_message(user_id, "🔍 Cari <b>universitas</b> (min 3 karakter):\n\nContoh: Stanford, MIT, UCLA")
-
-    elif step == "uni_search":
-        query = message.text.strip()
-        if len(query) < 3:
-            bot.send_message(user_id, "❌ Minimal 3 karakter")
-            return
+    results = await search_universities(query)
 
-        msg = bot.send_message(user_id, f"⏳ Searching '{query}'...")
+    if not results:
+        await bot.edit_message_text("❌ Tidak ada hasil. Coba kata kunci lain:", user_id, msg.message_id)
+        return
 
-        results = search_universities(query)
+    session["uni_results"] = results
 
-        if not results:
-            bot.edit_message_text("❌ Tidak ada hasil. Coba kata kunci lain:", user_id, msg.message_id)
-            return
+    # One button per row
+    keyboard = [[InlineKeyboardButton(uni["name"], callback_data=f"uni_{idx}")]
+                for idx, uni in enumerate(results[:10])]
+    keyboard.append([InlineKeyboardButton("🔍 Cari Lagi", callback_data="uni_search_again")])
+    markup = InlineKeyboardMarkup(keyboard)
 
-        session["uni_results"] = results
+    await bot.edit_message_text(f"📋 Ditemukan {len(results)} universitas:\n\nPilih salah satu:", user_id, msg.message_id, reply_markup=markup)
+    session["step"] = "uni_select"
 
-        markup = InlineKeyboardMarkup()
-        for idx, uni in enumerate(results[:10]):
-            markup.add(InlineKeyboardButton(uni["name"], callback_data=f"uni_{idx}"))
-        markup.add(InlineKeyboardButton("🔍 Cari Lagi", callback_data="uni_search_again"))
+STEP_HANDLERS = {
+    "url": _handle_url,
+    "first_name": _handle_first_name,
+    "last_name": _handle_last_name,
+    "email": _handle_email,
+    "dob": _handle_dob,
+    "uni_search": _handle_uni_search,
+}
 
-        bot.edit_message_text(f"📋 Ditemukan {len(results)} universitas:\n\nPilih salah satu:", user_id, msg.message_id, reply_markup=markup)
-        session["step"] = "uni_select"
+@bot.message_handler(func=lambda m: True)
+async def handle_message(message):
+    async with session_lock(message.chat.id):
+        user_id = message.chat.id
+        session = user_sessions.get(user_id, {})
+        step = session.get("step")
+
+        if not step:
+            await bot.send_message(user_id, "⚠️ Gunakan /verify untuk mulai")
+            return
 
-@bot.callback_query_handler(func=lambda call: call.data.startswith("uni_"))
-def handle_uni_callback(call):
-    user_id = call.message.chat.id
-    session = user_sessions.get(user_id, {})
+        handler = STEP_HANDLERS.get(step)
+        if handler:
+            await handler(message, session)
 
-    if call.data == "uni_search_again":
-        session["step"] = "uni_search"
-        bot.edit_message_text("🔍 Cari universitas (min 3 karakter):", user_id, call.message.message_id)
-        return
+@bot.callback_query_handler(func=lambda call: call.data.startswith("uni_"))
+async def handle_uni_callback(call):
+    async with session_lock(call.message.chat.id):
+        user_id = call.message.chat.id
+        session = user_sessions.get(user_id, {})
+
+        if call.data == "uni_search_again":
+            session["step"] = "uni_search"
+            await bot.edit_message_text("🔍 Cari universitas (min 3 karakter):", user_id, call.message.message_id)
+            return
 
-    try:
-        idx = int(call.data.split("_")[1])
-        selected_uni = session["uni_results"][idx]
+        try:
+            idx = int(call.data.split("_")[1])
+            selected_uni = session["uni_results"][idx]
 
-        org = {
-            "id": selected_uni["id"],
-            "idExtended": str(selected_uni["id"]),
-            "name": selected_uni["name"]
-        }
+            org = {
+                "id": selected_uni["id"],
+                "idExtended": str(selected_uni["id"]),
+                "name": selected_uni["name"]
+            }
 
-        bot.edit_message_text(f"✅ Dipilih: <b>{org['name']}</b>", user_id, call.message.message_id)
+            await bot.edit_message_text(f"✅ Dipilih: <b>{org['name']}</b>", user_id, call.message.message_id)
 
-        # Start verification
-        msg = bot.send_message(user_id, "⏳ <b>Processing verification...</b>\n\n🎨 Generating student ID card...")
+            # Start verification
+            msg = await bot.send_message(user_id, "⏳ <b>Processing verification...</b>\n\n🎨 Generating student ID card...")
 
-        user_data = {
-            "firstName": session["firstName"],
-            "lastName": session["lastName"],
-            "email": session["email"],
-            "birthDate": session["birthDate"]
-        }
+            user_data = {
+                "firstName": session["firstName"],
+                "lastName": session["lastName"],
+                "email": session["email"],
+                "birthDate": session["birthDate"]
+            }
 
-        verifier = GeminiVerifier(session["url"])
-        result = verifier.verify(user_data, org)
+            verifier = GeminiVerifier(session["url"])
+            result = await verifier.verify(user_data, org, initial_step=session.get("initial_step"))
 
-        if result.get("success"):
-            summary = f"""🎉 <b>SUCCESS!</b>
+            if result.get("success"):
+                summary = f"""🎉 <b>SUCCESS!</b>
 
 👤 Name: {user_data['firstName']} {user_data['lastName']}
 📧 Email: {user_data['email']}
@@ -529,30 +710,45 @@ def handle_uni_callback(call):
 
 {result.get('message', '')}"""
 
-            bot.edit_message_text(summary, user_id, msg.message_id)
-
-            # Send document to user (both instant and manual review cases)
-            if result.get("document"):
-                bot.send_document(
-                    user_id, 
-                    result["document"], 
-                    caption="📄 <b>Generated Student ID Card</b>\n\nDocument uploaded to SheerID for verification.",
-                    visible_file_name="student_id.png"
-                )
-            elif result.get("instant"):
-                # Instant verification - still send the card to user
-                bot.send_message(user_id, "🎊 No document needed - instant verification successful!")
-        else:
-            bot.edit_message_text(f"❌ <b>FAILED</b>\n\nError: {result.get('error')}", user_id, msg.message_id)
+                await bot.edit_message_text(summary, user_id, msg.message_id)
+
+                # Send document to user (both instant and manual review cases)
+                if result.get("document"):
+                    await bot.send_document(
+                        user_id, 
+                        result["document"], 
+                        caption="📄 <b>Generated Student ID Card</b>\n\nDocument uploaded to SheerID for verification.",
+                        visible_file_name="student_id.png"
+                    )
+                elif result.get("instant"):
+                    # Instant verification - still send the card to user
+                    await bot.send_message(user_id, "🎊 No document needed - instant verification successful!")
+            else:
+                await bot.edit_message_text(f"❌ <b>FAILED</b>\n\nError: {result.get('error')}", user_id, msg.message_id)
 
-        user_sessions[user_id] = {}
+            user_sessions[user_id] = {}
 
-    except Exception as e:
-        bot.send_message(user_id, f"❌ Error: {str(e)}")
-        user_sessions[user_id] = {}
+        except Exception as e:
+            await bot.send_message(user_id, f"❌ Error: {str(e)}")
+            user_sessions[user_id] = {}
 
 # ============ RUN BOT ============
+async def warm_up():
+    """Open a pooled connection to SheerID so the first user skips DNS + TLS setup"""
+    try:
+        await HTTP.get(f"{SHEERID_API_URL}/", timeout=5)
+    except httpx.HTTPError:
+        pass
+
+async def main():
+    warm = asyncio.create_task(warm_up())
+    try:
+        await bot.infinity_polling()
+    finally:
+        warm.cancel()
+        await HTTP.aclose()
+
 if __name__ == "__main__":
-    print("🤖 Bot started with Student ID Card Generator integration...")
-    print(f"📊 Stats file: {stats.file.absolute()}")
-    bot.infinity_polling()
+    log.info("🤖 Bot started with Student ID Card Generator integration...")
+    log.info("📊 Stats file: %s", stats.file.absolute())
+    asyncio.run(main())